@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .types import Event, EventStory, PhotoIndex, PhotoJSON
+
+
+def cache_paths(out_dir: str) -> Dict[str, str]:
+    root = os.path.join(out_dir, ".cache")
+    return {
+        "root": root,
+        "photo_json": os.path.join(root, "photo_json"),
+        "stories": os.path.join(root, "stories"),
+        "palettes": os.path.join(root, "palettes"),
+        "thumbs": os.path.join(root, "thumbs"),
+        "rollups": os.path.join(root, "rollups"),
+        "events": os.path.join(root, "events.json"),
+    }
+
+
+def _write_json(path: str, data: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _dt_to_str(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat() if dt else None
+
+
+def _dt_from_str(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    try:
+        return datetime.fromisoformat(s)
+    except Exception:
+        return None
+
+
+def photo_json_from_dict(data: Dict[str, Any]) -> PhotoJSON:
+    return PhotoJSON(
+        photo_id=data["photo_id"],
+        caption=data.get("caption", ""),
+        objects=data.get("objects", []),
+        scene_tags=data.get("scene_tags", []),
+        people_present=bool(data.get("people_present", False)),
+        num_people=int(data.get("num_people", 0)),
+        vibe_words=data.get("vibe_words", []),
+        possible_event=data.get("possible_event"),
+    )
+
+
+def load_photo_json(cache_dir: str, photo_id: str) -> Optional[PhotoJSON]:
+    data = _read_json(os.path.join(cache_dir, f"{photo_id}.json"))
+    if not isinstance(data, dict):
+        return None
+    try:
+        return photo_json_from_dict(data)
+    except Exception:
+        return None
+
+
+def save_photo_json(cache_dir: str, pj: PhotoJSON) -> None:
+    _write_json(os.path.join(cache_dir, f"{pj.photo_id}.json"), pj.__dict__)
+
+
+def _event_to_dict(ev: Event) -> Dict[str, Any]:
+    return {
+        "event_id": ev.event_id,
+        "start_time": _dt_to_str(ev.start_time),
+        "end_time": _dt_to_str(ev.end_time),
+        "center_lat": ev.center_lat,
+        "center_lon": ev.center_lon,
+        "photos": [
+            {
+                "photo_id": p.photo_id,
+                "filepath": p.filepath,
+                "datetime": _dt_to_str(p.datetime),
+                "lat": p.lat,
+                "lon": p.lon,
+            }
+            for p in ev.photos
+        ],
+    }
+
+
+class EventIndexWriter:
+    """Writes the event index one event at a time; the file is replaced atomically on close."""
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.count = 0
+        self._tmp = f"{path}.tmp{os.getpid()}"
+        self._f = open(self._tmp, "w", encoding="utf-8")
+        self._f.write("[")
+
+    def add(self, ev: Event) -> None:
+        self._f.write(",\n" if self.count else "\n")
+        json.dump(_event_to_dict(ev), self._f, ensure_ascii=False)
+        self.count += 1
+
+    def close(self) -> None:
+        self._f.write("\n]\n")
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def __enter__(self) -> "EventIndexWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+            os.remove(self._tmp)
+
+
+def save_events(path: str, events: Iterable[Event]) -> int:
+    with EventIndexWriter(path) as writer:
+        for ev in events:
+            writer.add(ev)
+    return writer.count
+
+
+def _event_from_dict(e: Dict[str, Any]) -> Event:
+    photos = [
+        PhotoIndex(
+            photo_id=p["photo_id"],
+            filepath=p["filepath"],
+            datetime=_dt_from_str(p.get("datetime")),
+            lat=p.get("lat"),
+            lon=p.get("lon"),
+        )
+        for p in e.get("photos", [])
+    ]
+    return Event(
+        event_id=e["event_id"],
+        photo_ids=[p.photo_id for p in photos],
+        start_time=_dt_from_str(e.get("start_time")),
+        end_time=_dt_from_str(e.get("end_time")),
+        center_lat=e.get("center_lat"),
+        center_lon=e.get("center_lon"),
+        photos=photos,
+    )
+
+
+def iter_saved_events(path: str) -> Iterator[Event]:
+    """Reads an index written by :class:`EventIndexWriter` one event per line."""
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line or line in ("[", "]"):
+                continue
+            yield _event_from_dict(json.loads(line))
+
+
+def load_events(path: str) -> List[Event]:
+    try:
+        return list(iter_saved_events(path))
+    except Exception:
+        return []
+
+
+def event_signature(photo_ids: Iterable[str]) -> str:
+    """Fingerprint of an event's photos.
+
+    Event ids are positional (``E0001`` is simply the first event), so after
+    re-clustering an id can name different photos; stories, palettes and rollup
+    stats carry this signature and are treated as missing when it differs.
+    """
+    return hashlib.sha1("\n".join(photo_ids).encode("utf-8")).hexdigest()[:16]
+
+
+def load_story(stories_dir: str, event_id: str, signature: Optional[str] = None) -> Optional[EventStory]:
+    data = _read_json(os.path.join(stories_dir, f"{event_id}.json"))
+    if not isinstance(data, dict):
+        return None
+    if signature is not None and data.get("signature") != signature:
+        return None
+    return EventStory(
+        title=str(data.get("title", "Untitled Event")),
+        story=str(data.get("story", "")),
+        highlights=[str(x) for x in (data.get("highlights") or [])],
+    )
+
+
+def save_story(stories_dir: str, event_id: str, story: EventStory, signature: Optional[str] = None) -> None:
+    _write_json(os.path.join(stories_dir, f"{event_id}.json"), {**story.__dict__, "signature": signature})
+
+
+def load_palette(palettes_dir: str, event_id: str, signature: Optional[str] = None) -> Optional[List[str]]:
+    data = _read_json(os.path.join(palettes_dir, f"{event_id}.json"))
+    if isinstance(data, list):
+        # Older caches stored the bare list, without a signature.
+        data = {"palette": data}
+    if not isinstance(data, dict) or not isinstance(data.get("palette"), list):
+        return None
+    if signature is not None and data.get("signature") != signature:
+        return None
+    return [str(x) for x in data["palette"]]
+
+
+def save_palette(palettes_dir: str, event_id: str, palette_hex: List[str], signature: Optional[str] = None) -> None:
+    _write_json(os.path.join(palettes_dir, f"{event_id}.json"), {"palette": palette_hex, "signature": signature})
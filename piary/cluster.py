@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 import math
 
 from .types import PhotoIndex, Event
@@ -34,18 +34,16 @@ def _cluster_center_lat_lon(photos: List[PhotoIndex]) -> Tuple[Optional[float],
     return lat, lon
 
 
-def cluster_events(
-    photos: List[PhotoIndex],
+def iter_events(
+    photos: Iterable[PhotoIndex],
     time_gap_hours: float = 6.0,
     distance_gap_km: float = 80.0,
     min_event_size: int = 3,
-) -> List[Event]:
-    if not photos:
-        return []
-
-    events: List[Event] = []
+) -> Iterator[Event]:
+    """Clusters a time-ordered stream of photos, yielding each event as soon as it closes."""
     current: List[PhotoIndex] = []
     threshold_seconds = time_gap_hours * 3600.0
+    n_events = 0
 
     for p in photos:
         if not current:
@@ -67,14 +65,32 @@ def cluster_events(
             current.append(p)
         else:
             if len(current) >= min_event_size:
-                events.append(_finalize_event(current, len(events)))
+                yield _finalize_event(current, n_events)
+                n_events += 1
             current = [p]
 
     if current:
         if len(current) >= min_event_size:
-            events.append(_finalize_event(current, len(events)))
+            yield _finalize_event(current, n_events)
+
 
-    return events
+def cluster_events(
+    photos: List[PhotoIndex],
+    time_gap_hours: float = 6.0,
+    distance_gap_km: float = 80.0,
+    min_event_size: int = 3,
+) -> List[Event]:
+    if not photos:
+        return []
+
+    return list(
+        iter_events(
+            photos,
+            time_gap_hours=time_gap_hours,
+            distance_gap_km=distance_gap_km,
+            min_event_size=min_event_size,
+        )
+    )
 
 
 def _finalize_event(photos: List[PhotoIndex], idx: int) -> Event:
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+from .scanner import _is_image
+
+
+API_BASE = "https://photoslibrary.googleapis.com"
+SCOPES = ["https://www.googleapis.com/auth/photoslibrary.readonly"]
+
+_STATE_FILE = ".gphotos_state.json"
+_PAGE_SIZE = 100
+_EXT_BY_MIME = {"image/jpeg": ".jpg", "image/png": ".png"}
+
+
+def load_credentials(client_secrets: str, token_path: str):
+    """OAuth installed-app flow with the token cached at ``token_path``."""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    creds = None
+    if os.path.exists(token_path):
+        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+    if creds and creds.valid:
+        return creds
+    if creds and creds.expired and creds.refresh_token:
+        creds.refresh(Request())
+    else:
+        flow = InstalledAppFlow.from_client_secrets_file(client_secrets, SCOPES)
+        creds = flow.run_local_server(port=0)
+    os.makedirs(os.path.dirname(os.path.abspath(token_path)), exist_ok=True)
+    with open(token_path, "w", encoding="utf-8") as f:
+        f.write(creds.to_json())
+    return creds
+
+
+def make_session(credentials=None, pool_size: int = 8, connect_retries: int = 3) -> requests.Session:
+    """A pooled session; with ``credentials`` an ``AuthorizedSession``, else a plain one
+    (e.g. for a local stand-in server).
+
+    The transport only retries failed connects, which never reach the server,
+    and never acts on a status code or Retry-After header. Status-based retries
+    happen in :class:`GooglePhotosClient` so that every attempt goes through its
+    rate limiter.
+    """
+    if credentials is not None:
+        from google.auth.transport.requests import AuthorizedSession
+
+        session: requests.Session = AuthorizedSession(credentials)
+    else:
+        session = requests.Session()
+    retry = Retry(
+        total=connect_retries,
+        connect=connect_retries,
+        read=0,
+        status=0,
+        other=0,
+        status_forcelist=(),
+        allowed_methods=frozenset(),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+        backoff_factor=0.5,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class RateLimiter:
+    """Token bucket shared by all threads using one client."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _parse_creation_time(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    try:
+        s = s.rstrip("Z")
+        if "." in s:
+            head, frac = s.split(".", 1)
+            s = f"{head}.{frac[:6]}"
+        dt = datetime.fromisoformat(s + "+00:00")
+        return dt.astimezone().replace(tzinfo=None)
+    except Exception:
+        return None
+
+
+class GooglePhotosClient:
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(
+        self,
+        session: requests.Session,
+        api_base: str = API_BASE,
+        rate: float = 10.0,
+        timeout: float = 60.0,
+        retries: int = 5,
+        backoff: float = 1.0,
+    ) -> None:
+        self.session = session
+        self.api_base = api_base.rstrip("/")
+        self.limiter = RateLimiter(rate)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends a request, retrying throttling, server and read errors.
+
+        Every attempt takes a rate-limiter token; waits honour Retry-After and
+        otherwise back off exponentially.
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                resp = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                wait = self.backoff * (2 ** attempt)
+            else:
+                if resp.status_code not in self.RETRY_STATUSES or attempt >= self.retries:
+                    resp.raise_for_status()
+                    return resp
+                wait = self.backoff * (2 ** attempt)
+                retry_after = resp.headers.get("Retry-After")
+                if retry_after:
+                    try:
+                        wait = max(wait, float(retry_after))
+                    except ValueError:
+                        pass
+                resp.close()
+            attempt += 1
+            time.sleep(wait)
+
+    def search_page(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        resp = self._request("POST", f"{self.api_base}/v1/mediaItems:search", json=body)
+        return resp.json()
+
+    def download(self, item: Dict[str, Any], dst: str, max_size: int) -> None:
+        suffix = f"=w{max_size}-h{max_size}" if max_size else "=d"
+        tmp = f"{dst}.part"
+        with self._request("GET", item["baseUrl"] + suffix, stream=True) as resp:
+            with open(tmp, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+        os.replace(tmp, dst)
+
+
+def _local_name(item: Dict[str, Any], max_size: int) -> str:
+    filename = item.get("filename") or item["id"]
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    ext = ext.lower()
+    if ext not in (".jpg", ".jpeg", ".png"):
+        # Sized downloads of other formats (HEIC, WebP, ...) come back as JPEG.
+        ext = _EXT_BY_MIME.get(item.get("mimeType", ""), ".jpg") if max_size else ext
+    return f"{stem}_{item['id'][-10:]}{ext}"
+
+
+def _load_state(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _save_state(path: str, state: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+@dataclass
+class SyncStats:
+    listed: int = 0
+    downloaded: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+
+def sync_google_photos(
+    client: GooglePhotosClient,
+    dest_dir: str,
+    max_size: int = 1600,
+    workers: int = 8,
+    restart: bool = False,
+    progress: bool = True,
+) -> SyncStats:
+    """Mirrors the library's photos into ``dest_dir``; scan that directory afterwards.
+
+    Every sync lists the whole library, so items uploaded late or dated in the
+    past are still picked up; files already on disk are never fetched again.
+    Progress is checkpointed by page token after every page, so an interrupted
+    sync resumes where it stopped (``restart`` ignores the checkpoint). Each
+    download's mtime is set to the item's creation time, since sized downloads
+    carry no EXIF.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    state_path = os.path.join(dest_dir, _STATE_FILE)
+    state = {} if restart else _load_state(state_path)
+    body = {"pageSize": _PAGE_SIZE, "filters": {"mediaTypeFilter": {"mediaTypes": ["PHOTO"]}}}
+    page_token = state.get("page_token")
+    stats = SyncStats()
+
+    def fetch(item: Dict[str, Any]) -> Optional[bool]:
+        """True if downloaded, False if already present, None on failure."""
+        dst = os.path.join(dest_dir, _local_name(item, max_size))
+        if os.path.exists(dst):
+            return False
+        try:
+            client.download(item, dst, max_size)
+        except Exception as e:
+            print(f"Failed to download {item.get('filename', item.get('id'))}: {e}")
+            return None
+        dt = _parse_creation_time((item.get("mediaMetadata") or {}).get("creationTime"))
+        if dt is not None:
+            ts = time.mktime(dt.timetuple())
+            os.utime(dst, (ts, ts))
+        return True
+
+    # After a failed download the checkpoint stays on that page, so the next
+    # sync lists it again; files that did arrive are skipped then.
+    failed = False
+    bar = tqdm(desc="Google Photos", unit="photo", disable=not progress)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, bar:
+        while True:
+            req = dict(body)
+            if page_token:
+                req["pageToken"] = page_token
+            try:
+                page = client.search_page(req)
+            except requests.HTTPError as e:
+                if page_token and e.response is not None and e.response.status_code == 400:
+                    # Stale page token: list again from the start; existing files are skipped.
+                    page_token = None
+                    continue
+                raise
+            items: List[Dict[str, Any]] = []
+            for it in page.get("mediaItems", []):
+                if not (it.get("mimeType") or "image/").startswith("image/"):
+                    continue
+                if not _is_image(_local_name(it, max_size)):
+                    # Originals (max_size 0) in formats the scanner cannot read,
+                    # e.g. HEIC or WebP; sized downloads of these come back as JPEG.
+                    stats.listed += 1
+                    stats.skipped += 1
+                    bar.update(1)
+                    continue
+                items.append(it)
+
+            for result in pool.map(fetch, items):
+                stats.listed += 1
+                if result is None:
+                    stats.failed += 1
+                    failed = True
+                elif result:
+                    stats.downloaded += 1
+                bar.update(1)
+
+            page_token = page.get("nextPageToken")
+            if not failed:
+                # None once the listing is complete, so the next sync starts over.
+                _save_state(state_path, {"page_token": page_token})
+            if not page_token:
+                return stats
@@ -26,7 +26,9 @@ def rgb_to_hex(rgb: Tuple[float, float, float]) -> str:
     return f"#{r:02x}{g:02x}{b:02x}"
 
 
-def dominant_palette(image_paths: List[str], k: int = 5, samples_per_image: int = 5000) -> List[str]:
+def dominant_palette_weighted(
+    image_paths: List[str], k: int = 5, samples_per_image: int = 5000
+) -> List[Tuple[str, float]]:
     samples: List[np.ndarray] = []
     for p in image_paths:
         try:
@@ -34,16 +36,20 @@ def dominant_palette(image_paths: List[str], k: int = 5, samples_per_image: int
         except Exception:
             continue
     if not samples:
-        return ["#777777", "#aaaaaa", "#333333"]
+        return [("#777777", 1 / 3), ("#aaaaaa", 1 / 3), ("#333333", 1 / 3)]
 
     X = np.vstack(samples)
     k = max(1, min(k, 8))
     km = KMeans(n_clusters=k, n_init=4, random_state=0)
     labels = km.fit_predict(X)
 
-    counts = np.bincount(labels)
+    counts = np.bincount(labels, minlength=k)
     centers = km.cluster_centers_.astype(float)
 
     order = np.argsort(-counts)
-    palette = [rgb_to_hex(tuple(centers[i])) for i in order]
-    return palette
+    total = float(counts.sum())
+    return [(rgb_to_hex(tuple(centers[i])), float(counts[i]) / total) for i in order if counts[i] > 0]
+
+
+def dominant_palette(image_paths: List[str], k: int = 5, samples_per_image: int = 5000) -> List[str]:
+    return [hex_ for hex_, _ in dominant_palette_weighted(image_paths, k=k, samples_per_image=samples_per_image)]
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import os
+from functools import lru_cache
 from datetime import datetime
 from urllib.parse import urljoin, urlparse
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List
 
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
@@ -20,23 +21,24 @@ def _fmt_date(dt: datetime) -> str:
     return dt.strftime("%Y-%m-%d")
 
 
-def render_event_storybook(
-    out_dir: str,
-    aggregate: EventAggregate,
-    story: EventStory,
-    palette_hex: List[str],
-) -> str:
-    os.makedirs(out_dir, exist_ok=True)
-
+@lru_cache(maxsize=1)
+def _env() -> Environment:
     template_dir = os.path.join(os.path.dirname(__file__), "templates")
-    env = Environment(
+    return Environment(
         loader=FileSystemLoader(template_dir),
         autoescape=select_autoescape(["html", "xml"]),
         trim_blocks=True,
         lstrip_blocks=True,
     )
 
-    template = env.get_template("storybook.html.j2")
+
+def render_event_html(
+    aggregate: EventAggregate,
+    story: EventStory,
+    palette_hex: List[str],
+    photo_uri: Callable[[PhotoIndex], str] = lambda p: _file_uri(p.filepath),
+) -> str:
+    template = _env().get_template("storybook.html.j2")
 
     event = aggregate.event
     start = _fmt_date(event.start_time) if event.start_time else ""
@@ -50,12 +52,12 @@ def render_event_storybook(
         photos_display.append(
             {
                 "photo_id": p.photo_id,
-                "uri": _file_uri(p.filepath),
+                "uri": photo_uri(p),
                 "caption": pj.caption if pj else "",
             }
         )
 
-    html = template.render(
+    return template.render(
         event_id=event.event_id,
         title=story.title,
         story=story.story,
@@ -70,7 +72,23 @@ def render_event_storybook(
         has_people=aggregate.has_people,
     )
 
-    out_path = os.path.join(out_dir, f"event_{event.event_id}.html")
+
+def render_index_html(entries: List[Dict[str, str]]) -> str:
+    template = _env().get_template("index.html.j2")
+    return template.render(events=entries)
+
+
+def render_event_storybook(
+    out_dir: str,
+    aggregate: EventAggregate,
+    story: EventStory,
+    palette_hex: List[str],
+) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+
+    html = render_event_html(aggregate, story, palette_hex)
+
+    out_path = os.path.join(out_dir, f"event_{aggregate.event.event_id}.html")
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(html)
 
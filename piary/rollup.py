@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cache import cache_paths, event_signature
+from .types import Event, EventStats, MoodBoard, PhotoJSON
+
+
+ROLLUP_KINDS = ("year", "month", "place")
+
+# Palette centroids are merged in a coarse RGB grid; each bin keeps the total
+# weight and the weighted channel sums, so adding and removing an event is exact.
+_PALETTE_BITS = 3
+_PLACE_DECIMALS = 1
+
+
+def _place_key(lat: Optional[float], lon: Optional[float]) -> Optional[str]:
+    if lat is None or lon is None:
+        return None
+    return f"{lat:.{_PLACE_DECIMALS}f},{lon:.{_PLACE_DECIMALS}f}"
+
+
+def _hex_to_rgb(hex_: str) -> Tuple[int, int, int]:
+    h = hex_.lstrip("#")
+    return int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
+
+
+def _palette_bin(rgb: Tuple[int, int, int]) -> str:
+    shift = 8 - _PALETTE_BITS
+    r, g, b = (c >> shift for c in rgb)
+    return str((r << (2 * _PALETTE_BITS)) | (g << _PALETTE_BITS) | b)
+
+
+def build_event_stats(
+    event: Event,
+    photos_json: List[PhotoJSON],
+    palette: List[Tuple[str, float]],
+) -> EventStats:
+    """Counts run over the analysed photos (``photos_json``), so people and photo counts share a denominator."""
+    ts = event.start_time
+    objects = Counter(o.strip().lower() for pj in photos_json for o in (pj.objects or []) if o.strip())
+    vibes = Counter(v.strip().lower() for pj in photos_json for v in (pj.vibe_words or []) if v.strip())
+    num_photos = len(photos_json)
+    return EventStats(
+        event_id=event.event_id,
+        month=ts.strftime("%Y-%m") if ts else None,
+        year=ts.strftime("%Y") if ts else None,
+        place=_place_key(event.center_lat, event.center_lon),
+        num_photos=num_photos,
+        object_counts=dict(objects),
+        vibe_counts=dict(vibes),
+        photos_with_people=sum(1 for pj in photos_json if pj.people_present),
+        num_people=sum(max(0, pj.num_people) for pj in photos_json),
+        palette=[(h, w * num_photos) for h, w in palette],
+        signature=event_signature(event.photo_ids),
+    )
+
+
+def _empty_bucket(kind: str, key: str) -> Dict[str, Any]:
+    return {
+        "kind": kind,
+        "key": key,
+        "num_events": 0,
+        "num_photos": 0,
+        "objects": {},
+        "vibes": {},
+        "photos_with_people": 0,
+        "num_people": 0,
+        "palette_bins": {},
+    }
+
+
+def _merge_counts(dst: Dict[str, int], src: Dict[str, int], sign: int) -> None:
+    for k, n in src.items():
+        v = dst.get(k, 0) + sign * n
+        if v > 0:
+            dst[k] = v
+        else:
+            dst.pop(k, None)
+
+
+def _merge_event(bucket: Dict[str, Any], stats: EventStats, sign: int) -> None:
+    bucket["num_events"] += sign
+    bucket["num_photos"] += sign * stats.num_photos
+    bucket["photos_with_people"] += sign * stats.photos_with_people
+    bucket["num_people"] += sign * stats.num_people
+    _merge_counts(bucket["objects"], stats.object_counts, sign)
+    _merge_counts(bucket["vibes"], stats.vibe_counts, sign)
+
+    bins = bucket["palette_bins"]
+    for hex_, w in stats.palette:
+        rgb = _hex_to_rgb(hex_)
+        key = _palette_bin(rgb)
+        acc = bins.get(key, [0.0, 0.0, 0.0, 0.0])
+        acc[0] += sign * w
+        for i in range(3):
+            acc[i + 1] += sign * w * rgb[i]
+        if acc[0] > 1e-9:
+            bins[key] = acc
+        else:
+            bins.pop(key, None)
+
+
+class RollupStore:
+    """Per-event statistics plus year/month/place buckets merged from them.
+
+    Every event and every bucket is its own small JSON file, so adding or
+    replacing an event rewrites only that event and the buckets it falls in.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _event_path(self, event_id: str) -> str:
+        return os.path.join(self.root, "events", f"{event_id}.json")
+
+    def _bucket_path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, f"{key}.json")
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _write(path: str, data: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def load_event(self, event_id: str) -> Optional[EventStats]:
+        data = self._read(self._event_path(event_id))
+        if data is None:
+            return None
+        data["palette"] = [tuple(x) for x in data.get("palette", [])]
+        return EventStats(**data)
+
+    def _bucket_keys(self, stats: EventStats) -> List[Tuple[str, str]]:
+        keys = [("year", stats.year), ("month", stats.month), ("place", stats.place)]
+        return [(kind, key) for kind, key in keys if key]
+
+    def _apply(self, stats: EventStats, sign: int, pending: Dict[Tuple[str, str], Dict[str, Any]]) -> None:
+        for kind, key in self._bucket_keys(stats):
+            bucket = pending.get((kind, key))
+            if bucket is None:
+                bucket = self._read(self._bucket_path(kind, key)) or _empty_bucket(kind, key)
+                pending[(kind, key)] = bucket
+            _merge_event(bucket, stats, sign)
+
+    def _flush(self, pending: Dict[Tuple[str, str], Dict[str, Any]]) -> None:
+        for (kind, key), bucket in pending.items():
+            path = self._bucket_path(kind, key)
+            if bucket["num_events"] <= 0:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                self._write(path, bucket)
+
+    def add_event(self, stats: EventStats) -> None:
+        pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        old = self.load_event(stats.event_id)
+        if old is not None:
+            self._apply(old, -1, pending)
+        self._apply(stats, +1, pending)
+        self._flush(pending)
+        self._write(self._event_path(stats.event_id), stats.__dict__)
+
+    def remove_event(self, event_id: str) -> None:
+        old = self.load_event(event_id)
+        if old is None:
+            return
+        pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._apply(old, -1, pending)
+        self._flush(pending)
+        os.remove(self._event_path(event_id))
+
+    def event_ids(self) -> List[str]:
+        return self.keys("events")
+
+    def prune(self, keep: Dict[str, str]) -> List[str]:
+        """Removes events not in ``keep`` (event id -> signature), including ids
+        that now name different photos after re-clustering."""
+        stale = []
+        for event_id in self.event_ids():
+            if event_id in keep:
+                old = self.load_event(event_id)
+                if old is None or old.signature == keep[event_id]:
+                    continue
+            stale.append(event_id)
+        for event_id in stale:
+            self.remove_event(event_id)
+        return stale
+
+    def keys(self, kind: str) -> List[str]:
+        try:
+            names = os.listdir(os.path.join(self.root, kind))
+        except FileNotFoundError:
+            return []
+        return sorted(n[: -len(".json")] for n in names if n.endswith(".json"))
+
+    def mood_board(self, kind: str, key: str, top: int = 10, palette_size: int = 5) -> Optional[MoodBoard]:
+        bucket = self._read(self._bucket_path(kind, key))
+        if bucket is None:
+            return None
+
+        def top_terms(counts: Dict[str, int]) -> List[str]:
+            return [t for t, _ in Counter(counts).most_common(top)]
+
+        bins = sorted(bucket["palette_bins"].values(), key=lambda acc: -acc[0])[:palette_size]
+        total_w = sum(acc[0] for acc in bins) or 1.0
+        palette_hex = [
+            "#" + "".join(f"{max(0, min(255, int(round(acc[i] / acc[0])))):02x}" for i in (1, 2, 3))
+            for acc in bins
+        ]
+        return MoodBoard(
+            top_people=[],
+            emotion_counts_by_person={},
+            palette_hex=palette_hex,
+            vibe_words_top=top_terms(bucket["vibes"]),
+            period=f"{kind}:{key}",
+            objects_top=top_terms(bucket["objects"]),
+            palette_weights=[acc[0] / total_w for acc in bins],
+            num_events=bucket["num_events"],
+            num_photos=bucket["num_photos"],
+            photos_with_people=bucket["photos_with_people"],
+            num_people=bucket["num_people"],
+        )
+
+
+def update_rollups(
+    out_dir: str,
+    event: Event,
+    photos_json: List[PhotoJSON],
+    palette: List[Tuple[str, float]],
+) -> EventStats:
+    stats = build_event_stats(event, photos_json, palette)
+    RollupStore(cache_paths(out_dir)["rollups"]).add_event(stats)
+    return stats
+
+
+def prune_rollups(out_dir: str, keep: Dict[str, str]) -> List[str]:
+    return RollupStore(cache_paths(out_dir)["rollups"]).prune(keep)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Piary: month/year/place mood boards")
+    ap.add_argument("--out-dir", default="./out", help="Output directory")
+    ap.add_argument("--by", choices=ROLLUP_KINDS, default="year")
+    ap.add_argument("keys", nargs="*", help="Bucket keys (e.g. 2025, 2025-01, '59.3,18.1'); all if omitted")
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+
+    store = RollupStore(cache_paths(os.path.abspath(args.out_dir))["rollups"])
+    for key in args.keys or store.keys(args.by):
+        board = store.mood_board(args.by, key, top=args.top)
+        if board is None:
+            print(f"{args.by} {key}: no data")
+            continue
+        print(json.dumps(board.__dict__, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,31 @@
 from __future__ import annotations
 
 import argparse
-import json
+import itertools
 import os
 from datetime import datetime
 from typing import List
 
 from tqdm import tqdm
 
-from .scanner import scan_photos
-from .cluster import cluster_events
+from .scanner import scan_photos_sorted
+from .cluster import iter_events
 from .vlm import infer_photo_json, infer_event_story
 from .aggregate import build_event_aggregate
-from .palette import dominant_palette
-from .types import PhotoJSON
+from .palette import dominant_palette_weighted
+from .rollup import prune_rollups, update_rollups
+from .search import update_search_index
+from .cache import (
+    cache_paths,
+    event_signature,
+    iter_saved_events,
+    load_photo_json,
+    save_photo_json,
+    save_events,
+    save_story,
+    save_palette,
+)
+from .types import EventAggregate, EventStory, PhotoIndex, PhotoJSON
 
 
 def _ensure_dir(path: str) -> None:
@@ -31,9 +43,64 @@ def _date_range_text(start, end) -> str:
     return s or e or ""
 
 
+def photo_jsons_for_event(
+    photos: List[PhotoIndex],
+    cache_dir: str,
+    model: str,
+    temperature: float,
+    recompute: bool = False,
+    progress: bool = True,
+    label: str = "",
+) -> List[PhotoJSON]:
+    photo_jsons: List[PhotoJSON] = []
+    iterator = tqdm(photos, desc=f"VLM per-photo {label}") if progress else photos
+    for p in iterator:
+        if not recompute:
+            pj = load_photo_json(cache_dir, p.photo_id)
+            if pj is not None:
+                photo_jsons.append(pj)
+                continue
+        try:
+            pj = infer_photo_json(model, p.filepath, p.photo_id, temperature=temperature)
+            photo_jsons.append(pj)
+            save_photo_json(cache_dir, pj)
+        except Exception as e:
+            print(f"Failed on {p.filepath}: {e}")
+    return photo_jsons
+
+
+def story_for_event(model: str, agg: EventAggregate, temperature: float) -> EventStory:
+    ev = agg.event
+    date_range = _date_range_text(ev.start_time, ev.end_time)
+    photo_items = [
+        {
+            "photo_id": pj.photo_id,
+            "caption": pj.caption,
+            "objects": pj.objects,
+            "scene_tags": pj.scene_tags,
+            "people_present": pj.people_present,
+            "num_people": pj.num_people,
+            "vibe_words": pj.vibe_words,
+            "possible_event": pj.possible_event,
+        }
+        for pj in agg.photos_json
+    ]
+
+    return infer_event_story(
+        model=model,
+        date_range=date_range,
+        location_text=agg.location_text or "",
+        uniq_objects=agg.uniq_objects,
+        uniq_scene_tags=agg.uniq_scene_tags,
+        uniq_vibe_words=agg.uniq_vibe_words,
+        photo_items=photo_items[:40],
+        temperature=max(0.2, min(0.6, temperature + 0.05)),
+    )
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(description="Ananda: one-model memory storybooks (local only)")
-    ap.add_argument("--photo-dir", required=True, help="Directory of photos (JPEG/PNG)")
+    ap.add_argument("--photo-dir", default=None, help="Directory of photos (JPEG/PNG)")
     ap.add_argument("--out-dir", default="./out", help="Output directory")
     ap.add_argument("--model", default="llava:13b", help="Ollama model name (e.g., llava:13b, qwen2-vl:7b)")
     ap.add_argument("--batch-size", type=int, default=4)
@@ -43,99 +110,100 @@ def main() -> None:
     ap.add_argument("--min-event-size", type=int, default=3)
     ap.add_argument("--max-photos-per-event", type=int, default=40)
     ap.add_argument("--recompute", action="store_true", help="Ignore cache and recompute per-photo JSON")
+    ap.add_argument("--google-photos-secrets", default=None, help="OAuth client secrets JSON; syncs Google Photos first")
+    ap.add_argument("--google-photos-dir", default=None, help="Where synced photos go (default: <out-dir>/google_photos)")
+    ap.add_argument("--google-photos-size", type=int, default=1600, help="Longest edge to download (0 = original)")
+    ap.add_argument("--google-photos-workers", type=int, default=8)
+    ap.add_argument("--google-photos-rps", type=float, default=10.0, help="Max API requests per second")
+    ap.add_argument("--google-photos-restart", action="store_true", help="Ignore the sync checkpoint and list from the start")
     args = ap.parse_args()
+    if not args.photo_dir and not args.google_photos_secrets:
+        ap.error("one of --photo-dir or --google-photos-secrets is required")
 
     out_dir = os.path.abspath(args.out_dir)
-    cache_dir = os.path.join(out_dir, ".cache", "photo_json")
+    paths = cache_paths(out_dir)
+    cache_dir = paths["photo_json"]
     _ensure_dir(cache_dir)
     _ensure_dir(out_dir)
 
-    working_photo_dir = args.photo_dir
+    photo_dirs = [args.photo_dir] if args.photo_dir else []
+    if args.google_photos_secrets:
+        from .gphotos import GooglePhotosClient, load_credentials, make_session, sync_google_photos
+
+        gphotos_dir = os.path.abspath(args.google_photos_dir or os.path.join(out_dir, "google_photos"))
+        creds = load_credentials(args.google_photos_secrets, os.path.join(paths["root"], "gphotos_token.json"))
+        client = GooglePhotosClient(
+            make_session(creds, pool_size=args.google_photos_workers),
+            rate=args.google_photos_rps,
+        )
+        print("Syncing Google Photos…")
+        synced = sync_google_photos(
+            client,
+            gphotos_dir,
+            max_size=args.google_photos_size,
+            workers=args.google_photos_workers,
+            restart=args.google_photos_restart,
+        )
+        print(
+            f"Google Photos: {synced.listed} listed, {synced.downloaded} downloaded, "
+            f"{synced.failed} failed, {synced.skipped} skipped (unsupported originals)"
+        )
+        # The sync directory is scanned with the other sources below, so photos
+        # synced by earlier runs are included too.
+        photo_dirs.append(gphotos_dir)
 
     print("Scanning photos…")
-    photos = scan_photos(working_photo_dir)
-    if not photos:
+    photos = scan_photos_sorted(photo_dirs)
+    first = next(photos, None)
+    if first is None:
         print("No photos found.")
         return
 
     print("Clustering events…")
-    events = cluster_events(
-        photos,
-        time_gap_hours=args.time_gap_hours,
-        distance_gap_km=args.distance_gap_km,
-        min_event_size=args.min_event_size,
+    num_events = save_events(
+        paths["events"],
+        iter_events(
+            itertools.chain([first], photos),
+            time_gap_hours=args.time_gap_hours,
+            distance_gap_km=args.distance_gap_km,
+            min_event_size=args.min_event_size,
+        ),
     )
 
-    if not events:
+    if not num_events:
         print("No events found with current thresholds.")
         return
 
-    print(f"Found {len(events)} events")
+    print(f"Found {num_events} events")
 
-    for ev in events:
+    signatures = {}
+    for ev in iter_saved_events(paths["events"]):
+        signature = signatures[ev.event_id] = event_signature(ev.photo_ids)
         print(f"Processing event {ev.event_id} with {len(ev.photo_ids)} photos…")
         selected = ev.photos[: args.max_photos_per_event]
 
-        photo_jsons: List[PhotoJSON] = []
-        for p in tqdm(selected, desc=f"VLM per-photo {ev.event_id}"):
-            cache_path = os.path.join(cache_dir, f"{p.photo_id}.json")
-            if os.path.exists(cache_path) and not args.recompute:
-                try:
-                    with open(cache_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    pj = PhotoJSON(
-                        photo_id=data["photo_id"],
-                        caption=data.get("caption", ""),
-                        objects=data.get("objects", []),
-                        scene_tags=data.get("scene_tags", []),
-                        people_present=bool(data.get("people_present", False)),
-                        num_people=int(data.get("num_people", 0)),
-                        vibe_words=data.get("vibe_words", []),
-                        possible_event=data.get("possible_event"),
-                    )
-                    photo_jsons.append(pj)
-                    continue
-                except Exception:
-                    pass
-            try:
-                pj = infer_photo_json(args.model, p.filepath, p.photo_id, temperature=args.temperature)
-                photo_jsons.append(pj)
-                with open(cache_path, "w", encoding="utf-8") as f:
-                    json.dump(pj.__dict__, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                print(f"Failed on {p.filepath}: {e}")
+        photo_jsons = photo_jsons_for_event(
+            selected,
+            cache_dir,
+            args.model,
+            args.temperature,
+            recompute=args.recompute,
+            label=ev.event_id,
+        )
 
         agg = build_event_aggregate(ev, photo_jsons)
 
-        date_range = _date_range_text(ev.start_time, ev.end_time)
-        photo_items = [
-            {
-                "photo_id": pj.photo_id,
-                "caption": pj.caption,
-                "objects": pj.objects,
-                "scene_tags": pj.scene_tags,
-                "people_present": pj.people_present,
-                "num_people": pj.num_people,
-                "vibe_words": pj.vibe_words,
-                "possible_event": pj.possible_event,
-            }
-            for pj in photo_jsons
-        ]
+        # Palette and rollups land before the story: piary.serve treats a saved
+        # story as a finished event.
+        print("Extracting palette…")
+        weighted_palette = dominant_palette_weighted([p.filepath for p in selected], k=5)
+        palette = [hex_ for hex_, _ in weighted_palette]
+        save_palette(paths["palettes"], ev.event_id, palette, signature)
+        update_rollups(out_dir, ev, photo_jsons, weighted_palette)
 
         print("Generating event story…")
-        story = infer_event_story(
-            model=args.model,
-            date_range=date_range,
-            location_text=agg.location_text or "",
-            uniq_objects=agg.uniq_objects,
-            uniq_scene_tags=agg.uniq_scene_tags,
-            uniq_vibe_words=agg.uniq_vibe_words,
-            photo_items=photo_items[:40],
-            temperature=max(0.2, min(0.6, args.temperature + 0.05)),
-        )
-
-        print("Extracting palette…")
-        palette = dominant_palette([p.filepath for p in selected], k=5)
+        story = story_for_event(args.model, agg, args.temperature)
+        save_story(paths["stories"], ev.event_id, story, signature)
 
         print("Rendering storybook…")
         from .render import render_event_storybook
@@ -143,6 +211,13 @@ def main() -> None:
         out_path = render_event_storybook(out_dir, agg, story, palette)
         print(f"Wrote {out_path}")
 
+    stale = prune_rollups(out_dir, signatures)
+    if stale:
+        print(f"Dropped {len(stale)} stale events from rollups")
+
+    print("Updating search index…")
+    update_search_index(out_dir)
+
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import heapq
 import os
+import pickle
+import tempfile
 from datetime import datetime
-from typing import List, Dict
+from typing import IO, AbstractSet, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
 from .types import PhotoIndex
 from .exif_utils import extract_time_and_gps
@@ -49,3 +52,177 @@ def scan_photos(photo_dir: str) -> List[PhotoIndex]:
 
     results.sort(key=lambda p: p.datetime or datetime.min)
     return results
+
+
+def _iter_image_entries(photo_dir: str, exclude: AbstractSet[str] = frozenset()) -> Iterator[os.DirEntry]:
+    """Image files under ``photo_dir``, skipping the subtrees of absolute paths in ``exclude``."""
+    stack = [photo_dir]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink() and not (exclude and os.path.abspath(entry.path) in exclude):
+                            stack.append(entry.path)
+                        continue
+                except OSError:
+                    continue
+                if _is_image(entry.name):
+                    yield entry
+
+
+def _photo_id_for(photo_dir: str, path: str) -> str:
+    # Derived from the path alone, so ids stay stable without remembering every
+    # basename seen so far. "%" is escaped before separators become "%2F", so
+    # distinct paths can never share an id.
+    rel = os.path.relpath(path, photo_dir)
+    return "%2F".join(part.replace("%", "%25") for part in rel.split(os.sep))
+
+
+def iter_photos(
+    photo_dir: str,
+    batch_size: int = 512,
+    id_prefix: str = "",
+    exclude: AbstractSet[str] = frozenset(),
+) -> Iterator[List[PhotoIndex]]:
+    """Yields photos under ``photo_dir`` in batches of at most ``batch_size``, in directory order.
+
+    Files at the top of ``photo_dir`` keep their basename as ``photo_id``; nested
+    files use their relative path with separators written as ``%2F`` (and a
+    literal ``%`` as ``%25``). ``id_prefix`` is prepended to every id, and
+    directories in ``exclude`` (absolute paths) are not descended into.
+    """
+    batch: List[PhotoIndex] = []
+    for entry in _iter_image_entries(photo_dir, exclude):
+        path = entry.path
+        dt, lat, lon = extract_time_and_gps(path)
+        if dt is None:
+            try:
+                dt = datetime.fromtimestamp(entry.stat().st_mtime)
+            except Exception:
+                dt = None
+        photo_id = id_prefix + _photo_id_for(photo_dir, path)
+        batch.append(PhotoIndex(photo_id=photo_id, filepath=path, datetime=dt, lat=lat, lon=lon))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _sort_key(p: PhotoIndex) -> Tuple[datetime, str]:
+    # The path breaks timestamp ties, so the order (and thus event ids) does
+    # not depend on scandir order or on where runs were split.
+    return p.datetime or datetime.min, p.filepath
+
+
+def _spill(run: List[PhotoIndex], tmp_dir: Optional[str]) -> IO[bytes]:
+    f = tempfile.TemporaryFile(prefix="piary-scan-", dir=tmp_dir)
+    pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+    for p in run:
+        pickler.dump((p.photo_id, p.filepath, p.datetime, p.lat, p.lon))
+        pickler.clear_memo()
+    f.seek(0)
+    return f
+
+
+def _read_run(f: IO[bytes]) -> Iterator[PhotoIndex]:
+    unpickler = pickle.Unpickler(f)
+    try:
+        while True:
+            photo_id, filepath, dt, lat, lon = unpickler.load()
+            yield PhotoIndex(photo_id=photo_id, filepath=filepath, datetime=dt, lat=lat, lon=lon)
+    except EOFError:
+        return
+    finally:
+        f.close()
+
+
+def sort_photos_by_time(
+    photos: Iterable[PhotoIndex],
+    run_size: int = 50000,
+    tmp_dir: Optional[str] = None,
+) -> Iterator[PhotoIndex]:
+    """External sort on timestamp, then path (undated photos first).
+
+    At most ``run_size`` photos are held in memory; larger inputs are written
+    to sorted temporary runs and merged lazily.
+    """
+    runs: List[IO[bytes]] = []
+    run: List[PhotoIndex] = []
+    try:
+        for p in photos:
+            run.append(p)
+            if len(run) >= run_size:
+                run.sort(key=_sort_key)
+                runs.append(_spill(run, tmp_dir))
+                run = []
+        run.sort(key=_sort_key)
+        if not runs:
+            yield from run
+            return
+        if run:
+            runs.append(_spill(run, tmp_dir))
+            run = []
+        yield from heapq.merge(*(_read_run(f) for f in runs), key=_sort_key)
+    finally:
+        for f in runs:
+            f.close()
+
+
+def _sources(photo_dirs: Sequence[str]) -> List[Tuple[str, str, FrozenSet[str]]]:
+    """``(dir, id_prefix, exclude)`` for each distinct source directory.
+
+    A single source keeps plain ids. With several, ids are prefixed with the
+    directory's name (made unique, e.g. ``google_photos%2F...``) so the same
+    relative path in two sources cannot clash, and a source nested inside
+    another is left out of the outer walk so its photos are scanned only once.
+    """
+    dirs: List[str] = []
+    roots: List[str] = []
+    for d in photo_dirs:
+        root = os.path.abspath(d)
+        if root not in roots:
+            dirs.append(d)
+            roots.append(root)
+    if len(dirs) == 1:
+        return [(dirs[0], "", frozenset())]
+
+    sources = []
+    tags: Set[str] = set()
+    for d, root in zip(dirs, roots):
+        name = (os.path.basename(root) or "root").replace("%", "%25")
+        tag, n = name, 1
+        while tag in tags:
+            n += 1
+            tag = f"{name}-{n}"
+        tags.add(tag)
+        nested = frozenset(r for r in roots if r != root and r.startswith(os.path.join(root, "")))
+        sources.append((d, f"{tag}%2F", nested))
+    return sources
+
+
+def scan_photos_sorted(
+    photo_dirs: Union[str, Sequence[str]],
+    batch_size: int = 512,
+    run_size: int = 50000,
+    tmp_dir: Optional[str] = None,
+) -> Iterator[PhotoIndex]:
+    """Time-ordered stream of photos under one or more directories in bounded memory.
+
+    See :func:`_sources` for how ids stay unique across several directories.
+    """
+    if isinstance(photo_dirs, str):
+        photo_dirs = [photo_dirs]
+    photos = (
+        p
+        for d, id_prefix, exclude in _sources(photo_dirs)
+        for batch in iter_photos(d, batch_size=batch_size, id_prefix=id_prefix, exclude=exclude)
+        for p in batch
+    )
+    return sort_photos_by_time(photos, run_size=run_size, tmp_dir=tmp_dir)
@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import argparse
+import heapq
+import math
+import os
+import pickle
+import re
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .cache import cache_paths, load_photo_json
+from .types import PhotoJSON
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_TEXT_FIELDS = ("objects", "scene", "vibe", "caption", "event")
+_FIELD_ALIASES = {
+    "object": "objects",
+    "objects": "objects",
+    "scene": "scene",
+    "scene_tags": "scene",
+    "tag": "scene",
+    "vibe": "vibe",
+    "vibe_words": "vibe",
+    "caption": "caption",
+    "event": "event",
+    "possible_event": "event",
+}
+_PEOPLE_TERM = "people:present"
+
+_INDEX_VERSION = 2
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def _tokens(text: str) -> List[str]:
+    return [sys.intern(t) for t in _TOKEN_RE.findall(text.lower())]
+
+
+def _doc_terms(pj: PhotoJSON) -> Tuple[Dict[str, int], int]:
+    """Returns field-qualified term frequencies and the caption length."""
+    tf: Dict[str, int] = {}
+
+    def add(field: str, values: Iterable[str]) -> int:
+        n = 0
+        for v in values:
+            for t in _tokens(str(v)):
+                term = sys.intern(f"{field}:{t}")
+                tf[term] = tf.get(term, 0) + 1
+                n += 1
+        return n
+
+    add("objects", pj.objects or [])
+    add("scene", pj.scene_tags or [])
+    add("vibe", pj.vibe_words or [])
+    add("event", [pj.possible_event] if pj.possible_event else [])
+    caption_len = add("caption", [pj.caption or ""])
+    if pj.people_present:
+        tf[_PEOPLE_TERM] = 1
+    return tf, caption_len
+
+
+class SearchIndex:
+    """Inverted index over the per-photo JSON cache.
+
+    Documents are numbered in insertion order, so every posting list is an
+    ``array('I')`` that stays sorted by construction, with a parallel
+    ``array('H')`` of term frequencies. Updated or removed photos are
+    tombstoned and reclaimed by :meth:`compact`.
+    """
+
+    def __init__(self) -> None:
+        self.photo_ids: List[str] = []
+        self.alive = bytearray()
+        self.caption_len = array("H")
+        self.term_ids: Dict[str, int] = {}
+        self.postings: List[array] = []
+        self.freqs: List[array] = []
+        self.doc_of: Dict[str, int] = {}
+        self.mtimes: Dict[str, float] = {}
+        self.num_alive = 0
+        self.caption_len_total = 0
+        self.dir_mtime_ns: Optional[int] = None
+
+    # -- building -----------------------------------------------------------
+
+    def add(self, pj: PhotoJSON, mtime: float = 0.0) -> None:
+        self.remove(pj.photo_id)
+        doc = len(self.photo_ids)
+        tf, caption_len = _doc_terms(pj)
+        for term, n in tf.items():
+            tid = self.term_ids.get(term)
+            if tid is None:
+                tid = len(self.postings)
+                self.term_ids[term] = tid
+                self.postings.append(array("I"))
+                self.freqs.append(array("H"))
+            self.postings[tid].append(doc)
+            self.freqs[tid].append(min(n, 0xFFFF))
+        self.photo_ids.append(sys.intern(pj.photo_id))
+        self.alive.append(1)
+        self.caption_len.append(min(caption_len, 0xFFFF))
+        self.doc_of[pj.photo_id] = doc
+        self.mtimes[pj.photo_id] = mtime
+        self.num_alive += 1
+        self.caption_len_total += self.caption_len[doc]
+
+    def remove(self, photo_id: str) -> None:
+        doc = self.doc_of.pop(photo_id, None)
+        self.mtimes.pop(photo_id, None)
+        if doc is None or not self.alive[doc]:
+            return
+        self.alive[doc] = 0
+        self.num_alive -= 1
+        self.caption_len_total -= self.caption_len[doc]
+
+    def compact(self) -> None:
+        if self.num_alive == len(self.photo_ids):
+            return
+        remap = array("i", [-1]) * len(self.photo_ids)
+        photo_ids: List[str] = []
+        caption_len = array("H")
+        for doc, pid in enumerate(self.photo_ids):
+            if self.alive[doc]:
+                remap[doc] = len(photo_ids)
+                photo_ids.append(pid)
+                caption_len.append(self.caption_len[doc])
+
+        term_ids: Dict[str, int] = {}
+        postings: List[array] = []
+        freqs: List[array] = []
+        for term, tid in self.term_ids.items():
+            post = array("I")
+            freq = array("H")
+            for doc, n in zip(self.postings[tid], self.freqs[tid]):
+                new = remap[doc]
+                if new >= 0:
+                    post.append(new)
+                    freq.append(n)
+            if post:
+                term_ids[term] = len(postings)
+                postings.append(post)
+                freqs.append(freq)
+
+        self.photo_ids = photo_ids
+        self.alive = bytearray([1]) * len(photo_ids)
+        self.caption_len = caption_len
+        self.term_ids = term_ids
+        self.postings = postings
+        self.freqs = freqs
+        self.doc_of = {pid: i for i, pid in enumerate(photo_ids)}
+
+    def update_from_cache(self, photo_json_dir: str) -> int:
+        """Syncs the index with the photo-JSON cache; returns the number of photos (re)indexed.
+
+        Cache files are written via rename, so an unchanged directory mtime
+        means nothing was added, replaced or removed and the scan is skipped.
+        """
+        try:
+            dir_mtime_ns: Optional[int] = os.stat(photo_json_dir).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime_ns = None
+        if dir_mtime_ns is not None and dir_mtime_ns == self.dir_mtime_ns:
+            return 0
+        # On coarse-grained filesystems a write later in the same tick would
+        # keep the mtime unchanged, so only trust mtimes that have settled.
+        if dir_mtime_ns is not None and time.time_ns() - dir_mtime_ns < 2_000_000_000:
+            dir_mtime_ns = None
+
+        changed = 0
+        present: Set[str] = set()
+        try:
+            entries = os.scandir(photo_json_dir)
+        except FileNotFoundError:
+            entries = None
+        if entries is not None:
+            with entries:
+                for entry in entries:
+                    if not entry.name.endswith(".json") or not entry.is_file():
+                        continue
+                    photo_id = entry.name[: -len(".json")]
+                    present.add(photo_id)
+                    mtime = entry.stat().st_mtime
+                    if self.mtimes.get(photo_id) == mtime:
+                        continue
+                    pj = load_photo_json(photo_json_dir, photo_id)
+                    if pj is None:
+                        self.remove(photo_id)
+                        continue
+                    pj.photo_id = photo_id
+                    self.add(pj, mtime)
+                    changed += 1
+        for photo_id in [pid for pid in self.doc_of if pid not in present]:
+            self.remove(photo_id)
+            changed += 1
+        if self.num_alive < 0.75 * len(self.photo_ids):
+            self.compact()
+        self.dir_mtime_ns = dir_mtime_ns
+        return changed
+
+    # -- persistence --------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump((_INDEX_VERSION, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SearchIndex":
+        idx = cls()
+        try:
+            with open(path, "rb") as f:
+                version, state = pickle.load(f)
+            if version == _INDEX_VERSION:
+                idx.__dict__.update(state)
+        except Exception:
+            pass
+        return idx
+
+    # -- querying -----------------------------------------------------------
+
+    def _docs(self, term: str) -> Set[int]:
+        tid = self.term_ids.get(term)
+        if tid is None:
+            return set()
+        docs = set(self.postings[tid])
+        if self.num_alive != len(self.photo_ids):
+            alive = self.alive
+            docs = {d for d in docs if alive[d]}
+        return docs
+
+    def _all_docs(self) -> Set[int]:
+        if self.num_alive == len(self.photo_ids):
+            return set(range(len(self.photo_ids)))
+        return {d for d, a in enumerate(self.alive) if a}
+
+    def _word_docs(self, word: str) -> Tuple[Set[int], List[str]]:
+        """Docs matching one query word, plus the caption terms to rank by."""
+        field: Optional[str] = None
+        if ":" in word:
+            prefix, rest = word.split(":", 1)
+            field = _FIELD_ALIASES.get(prefix.lower())
+            if field is not None:
+                word = rest
+        if field is None and word.lower() in ("people_present", "people:present", "has_people"):
+            return self._docs(_PEOPLE_TERM), []
+
+        toks = _tokens(word)
+        if not toks:
+            return set(), []
+        fields = (field,) if field else _TEXT_FIELDS
+        result: Optional[Set[int]] = None
+        for t in toks:
+            docs: Set[int] = set()
+            for f in fields:
+                docs |= self._docs(f"{f}:{t}")
+            result = docs if result is None else result & docs
+        rank_terms = [f"caption:{t}" for t in toks] if "caption" in fields else []
+        return result or set(), rank_terms
+
+    def _bm25(self, docs: Set[int], rank_terms: List[str]) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        n = self.num_alive
+        if not n or not docs:
+            return scores
+        avgdl = max(self.caption_len_total / n, 1.0)
+        lens = self.caption_len
+        k1 = _BM25_K1
+        for term in set(rank_terms):
+            tid = self.term_ids.get(term)
+            if tid is None:
+                continue
+            post = self.postings[tid]
+            df = len(post) if n == len(self.photo_ids) else len(self._docs(term))
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            a = k1 * (1.0 - _BM25_B)
+            c = k1 * _BM25_B / avgdl
+            w = idf * (k1 + 1.0)
+            for d, tf in zip(post, self.freqs[tid]):
+                if d in docs:
+                    scores[d] = scores.get(d, 0.0) + w * tf / (tf + a + c * lens[d])
+        return scores
+
+    def search(self, query: str, limit: Optional[int] = 20) -> List[Tuple[str, float]]:
+        """Evaluates a boolean query and ranks matches by BM25 over captions.
+
+        Words are implicitly ANDed; ``AND``, ``OR``, ``NOT`` and parentheses
+        are supported, and ``field:word`` restricts a word to one of
+        objects, scene, vibe, caption or event. ``people_present`` matches
+        photos the VLM saw people in. Raises ``ValueError`` for a malformed
+        query (unbalanced parentheses, an operator with a missing operand).
+        """
+        docs, rank_terms = _QueryParser(self, query).parse()
+        scores = self._bm25(docs, rank_terms)
+        scored = [(-s, d) for d, s in scores.items()]
+        ranked = sorted(scored) if limit is None else heapq.nsmallest(limit, scored)
+        if limit is None or len(ranked) < limit:
+            rest = sorted(docs.difference(scores))
+            ranked.extend((-0.0, d) for d in (rest if limit is None else rest[: limit - len(ranked)]))
+        return [(self.photo_ids[d], -s) for s, d in ranked]
+
+
+class _QueryParser:
+    # query := or ; or := and ("OR" and)* ; and := not ("AND"? not)* ; not := "NOT" not | atom
+    _LEX_RE = re.compile(r"\(|\)|[^\s()]+")
+
+    def __init__(self, index: SearchIndex, query: str) -> None:
+        self.index = index
+        self.toks = self._LEX_RE.findall(query)
+        self.pos = 0
+        self.rank_terms: List[str] = []
+
+    def parse(self) -> Tuple[Set[int], List[str]]:
+        if not self.toks:
+            return set(), []
+        docs = self._or(negated=False)
+        tok = self._peek()
+        if tok is not None:
+            raise ValueError(f"unexpected {tok!r} at token {self.pos + 1}")
+        return docs, self.rank_terms
+
+    def _peek(self) -> Optional[str]:
+        return self.toks[self.pos] if self.pos < len(self.toks) else None
+
+    def _or(self, negated: bool) -> Set[int]:
+        docs = self._and(negated)
+        while self._peek() == "OR":
+            self.pos += 1
+            docs = docs | self._and(negated)
+        return docs
+
+    def _and(self, negated: bool) -> Set[int]:
+        docs = self._not(negated)
+        while True:
+            tok = self._peek()
+            if tok is None or tok in ("OR", ")"):
+                return docs
+            if tok == "AND":
+                self.pos += 1
+            docs = docs & self._not(negated)
+
+    def _not(self, negated: bool) -> Set[int]:
+        if self._peek() == "NOT":
+            self.pos += 1
+            return self.index._all_docs() - self._not(not negated)
+        return self._atom(negated)
+
+    def _atom(self, negated: bool) -> Set[int]:
+        tok = self._peek()
+        if tok is None:
+            raise ValueError("query ends where a word was expected")
+        if tok in ("AND", "OR", ")"):
+            raise ValueError(f"expected a word before {tok!r} at token {self.pos + 1}")
+        self.pos += 1
+        if tok == "(":
+            docs = self._or(negated)
+            if self._peek() != ")":
+                raise ValueError("missing ')'")
+            self.pos += 1
+            return docs
+        docs, rank_terms = self.index._word_docs(tok)
+        if not negated:
+            self.rank_terms.extend(rank_terms)
+        return docs
+
+
+def index_path(out_dir: str) -> str:
+    return os.path.join(cache_paths(out_dir)["root"], "search_index.pkl")
+
+
+def update_search_index(out_dir: str, rebuild: bool = False) -> SearchIndex:
+    path = index_path(out_dir)
+    idx = SearchIndex() if rebuild else SearchIndex.load(path)
+    seen_mtime = idx.dir_mtime_ns
+    changed = idx.update_from_cache(cache_paths(out_dir)["photo_json"])
+    if changed or rebuild or idx.dir_mtime_ns != seen_mtime:
+        idx.save(path)
+    return idx
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Piary: search per-photo VLM output")
+    ap.add_argument("query", nargs="+", help='Query, e.g. "beach AND people_present" or "vibe:calm NOT indoor"')
+    ap.add_argument("--out-dir", default="./out", help="Output directory")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--rebuild", action="store_true", help="Rebuild the index from scratch")
+    ap.add_argument("--no-update", action="store_true", help="Query the saved index without syncing it first")
+    args = ap.parse_args()
+
+    out_dir = os.path.abspath(args.out_dir)
+    if args.no_update and not args.rebuild:
+        idx = SearchIndex.load(index_path(out_dir))
+    else:
+        idx = update_search_index(out_dir, rebuild=args.rebuild)
+    photo_json_dir = cache_paths(out_dir)["photo_json"]
+    try:
+        results = idx.search(" ".join(args.query), limit=args.limit)
+    except ValueError as e:
+        ap.error(f"bad query: {e}")
+    for photo_id, score in results:
+        pj = load_photo_json(photo_json_dir, photo_id)
+        caption = pj.caption if pj else ""
+        print(f"{photo_id}\t{score:.3f}\t{caption}")
+
+
+if __name__ == "__main__":
+    main()
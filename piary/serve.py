@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import queue
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from flask import Flask, abort, send_file, url_for
+from PIL import Image, ImageOps
+
+from .aggregate import build_event_aggregate
+from .cache import (
+    cache_paths,
+    event_signature,
+    load_events,
+    load_palette,
+    load_photo_json,
+    load_story,
+    save_events,
+    save_palette,
+    save_story,
+)
+from .cluster import iter_events
+from .palette import dominant_palette_weighted
+from .render import render_event_html, render_index_html
+from .rollup import prune_rollups, update_rollups
+from .run import _date_range_text, photo_jsons_for_event, story_for_event
+from .scanner import scan_photos_sorted
+from .types import Event, EventAggregate, EventStory, PhotoIndex
+
+
+class _LRU:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            val = self._data.get(key)
+            if val is not None:
+                self._data.move_to_end(key)
+            return val
+
+    def put(self, key: str, val: str) -> None:
+        with self._lock:
+            self._data[key] = val
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class StoryWorker:
+    """Generates per-photo JSON, palette and story for events in a background thread.
+
+    Events requested by a viewer jump ahead of the ones queued at startup.
+    """
+
+    PRIORITY_VIEWED = 0
+    PRIORITY_BACKLOG = 1
+
+    def __init__(
+        self,
+        events: Dict[str, Event],
+        out_dir: str,
+        model: str,
+        temperature: float,
+        max_photos_per_event: int,
+        on_done=None,
+    ) -> None:
+        self.events = events
+        self.out_dir = out_dir
+        self.paths = cache_paths(out_dir)
+        self.model = model
+        self.temperature = temperature
+        self.max_photos_per_event = max_photos_per_event
+        self.on_done = on_done
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._done: Set[str] = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="piary-stories", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, event_id: str, priority: int = PRIORITY_BACKLOG) -> None:
+        with self._lock:
+            if event_id in self._done:
+                return
+        self._queue.put((priority, next(self._seq), event_id))
+
+    def _run(self) -> None:
+        while True:
+            _, _, event_id = self._queue.get()
+            with self._lock:
+                if event_id in self._done:
+                    continue
+            try:
+                self._generate(event_id)
+            except Exception as e:
+                # Not marked done, so the next view of the page submits it again.
+                print(f"Story generation failed for {event_id}: {e}")
+                continue
+            with self._lock:
+                self._done.add(event_id)
+            if self.on_done is not None:
+                self.on_done(event_id)
+
+    def _generate(self, event_id: str) -> None:
+        ev = self.events[event_id]
+        signature = event_signature(ev.photo_ids)
+        has_story = load_story(self.paths["stories"], event_id, signature) is not None
+        has_palette = load_palette(self.paths["palettes"], event_id, signature) is not None
+        if has_story and has_palette:
+            return
+        selected = ev.photos[: self.max_photos_per_event]
+        photo_jsons = photo_jsons_for_event(
+            selected,
+            self.paths["photo_json"],
+            self.model,
+            self.temperature,
+            progress=False,
+        )
+        if selected and not photo_jsons:
+            raise RuntimeError("no per-photo JSON could be produced")
+        # A run interrupted between story and palette leaves only the story; the
+        # palette and rollups are filled in without rewriting it.
+        if not has_palette:
+            weighted_palette = dominant_palette_weighted([p.filepath for p in selected], k=5)
+            save_palette(self.paths["palettes"], event_id, [hex_ for hex_, _ in weighted_palette], signature)
+            update_rollups(self.out_dir, ev, photo_jsons, weighted_palette)
+        if not has_story:
+            agg = build_event_aggregate(ev, photo_jsons)
+            story = story_for_event(self.model, agg, self.temperature)
+            save_story(self.paths["stories"], event_id, story, signature)
+
+
+def _cached_aggregate(ev: Event, photo_json_dir: str, max_photos: int) -> EventAggregate:
+    photo_jsons = []
+    for p in ev.photos[:max_photos]:
+        pj = load_photo_json(photo_json_dir, p.photo_id)
+        if pj is not None:
+            photo_jsons.append(pj)
+    return build_event_aggregate(ev, photo_jsons)
+
+
+def _is_finished(paths: Dict[str, str], event_id: str, signature: str) -> bool:
+    """An event is done once both its story and its palette (with rollups) are cached for its photos."""
+    return (
+        load_story(paths["stories"], event_id, signature) is not None
+        and load_palette(paths["palettes"], event_id, signature) is not None
+    )
+
+
+def _pending_story(ev: Event) -> EventStory:
+    return EventStory(
+        title=f"Event {ev.event_id}",
+        story="This story is still being written. Reload the page in a little while.",
+        highlights=[],
+    )
+
+
+def _make_thumbnail(src: str, dst: str, size: int) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.tmp{threading.get_ident()}"
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((size, size))
+        img.save(tmp, format="JPEG", quality=85)
+    os.replace(tmp, dst)
+
+
+def load_or_build_events(
+    out_dir: str,
+    photo_dir: Optional[str],
+    time_gap_hours: float = 6.0,
+    distance_gap_km: float = 80.0,
+    min_event_size: int = 3,
+    rescan: bool = False,
+) -> List[Event]:
+    """Cached events, or a fresh scan of ``photo_dir`` if there are none or ``rescan`` is set."""
+    events_path = cache_paths(out_dir)["events"]
+    if not photo_dir or (os.path.exists(events_path) and not rescan):
+        return load_events(events_path)
+    events = list(
+        iter_events(
+            scan_photos_sorted(photo_dir),
+            time_gap_hours=time_gap_hours,
+            distance_gap_km=distance_gap_km,
+            min_event_size=min_event_size,
+        )
+    )
+    save_events(events_path, events)
+    prune_rollups(out_dir, {ev.event_id: event_signature(ev.photo_ids) for ev in events})
+    return events
+
+
+def create_app(
+    out_dir: str,
+    events: List[Event],
+    model: str = "llava:13b",
+    temperature: float = 0.25,
+    max_photos_per_event: int = 40,
+    page_cache_size: int = 64,
+    thumb_size: int = 1024,
+    background: bool = True,
+) -> Flask:
+    app = Flask(__name__)
+    paths = cache_paths(out_dir)
+    events_by_id: Dict[str, Event] = {ev.event_id: ev for ev in events}
+    photos_by_id: Dict[str, PhotoIndex] = {p.photo_id: p for ev in events for p in ev.photos}
+    signatures: Dict[str, str] = {ev.event_id: event_signature(ev.photo_ids) for ev in events}
+    pages = _LRU(page_cache_size)
+
+    worker: Optional[StoryWorker] = None
+    if background:
+        worker = StoryWorker(
+            events_by_id,
+            out_dir,
+            model,
+            temperature,
+            max_photos_per_event,
+            on_done=pages.pop,
+        )
+        for ev in events:
+            if not _is_finished(paths, ev.event_id, signatures[ev.event_id]):
+                worker.submit(ev.event_id)
+        worker.start()
+
+    def thumb_uri(p: PhotoIndex) -> str:
+        return url_for("thumbnail", photo_id=p.photo_id)
+
+    @app.route("/")
+    def index():
+        entries = []
+        for ev in events:
+            story = load_story(paths["stories"], ev.event_id, signatures[ev.event_id])
+            entries.append(
+                {
+                    "event_id": ev.event_id,
+                    "href": url_for("event_page", event_id=ev.event_id),
+                    "title": story.title if story else f"Event {ev.event_id}",
+                    "date_range": _date_range_text(ev.start_time, ev.end_time),
+                    "num_photos": len(ev.photos),
+                    "cover_uri": thumb_uri(ev.photos[0]) if ev.photos else "",
+                    "has_story": story is not None,
+                }
+            )
+        return render_index_html(entries)
+
+    @app.route("/event/<event_id>")
+    def event_page(event_id: str):
+        ev = events_by_id.get(event_id)
+        if ev is None:
+            abort(404)
+        html = pages.get(event_id)
+        if html is not None:
+            return html
+
+        story = load_story(paths["stories"], event_id, signatures[event_id])
+        palette = load_palette(paths["palettes"], event_id, signatures[event_id])
+        finished = story is not None and palette is not None
+        if not finished and worker is not None:
+            worker.submit(event_id, StoryWorker.PRIORITY_VIEWED)
+        agg = _cached_aggregate(ev, paths["photo_json"], max_photos_per_event)
+        html = render_event_html(agg, story or _pending_story(ev), palette or [], photo_uri=thumb_uri)
+        # Only memoize finished pages; pending ones must pick up the story once it lands.
+        if finished:
+            pages.put(event_id, html)
+        return html
+
+    @app.route("/thumb/<photo_id>")
+    def thumbnail(photo_id: str):
+        p = photos_by_id.get(photo_id)
+        if p is None or not os.path.exists(p.filepath):
+            abort(404)
+        dst = os.path.join(paths["thumbs"], f"{photo_id}.{thumb_size}.jpg")
+        if not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(p.filepath):
+            try:
+                _make_thumbnail(p.filepath, dst, thumb_size)
+            except Exception:
+                abort(404)
+        return send_file(dst, mimetype="image/jpeg", conditional=True, etag=True, max_age=86400)
+
+    return app
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Piary: browse storybooks, generating them on demand")
+    ap.add_argument("--out-dir", default="./out", help="Output directory (shared with piary.run)")
+    ap.add_argument("--photo-dir", default=None, help="Directory of photos; scanned if no event index is cached yet")
+    ap.add_argument("--rescan", action="store_true", help="Scan --photo-dir again even if an event index is cached")
+    ap.add_argument("--model", default="llava:13b", help="Ollama model name (e.g., llava:13b, qwen2-vl:7b)")
+    ap.add_argument("--temperature", type=float, default=0.25)
+    ap.add_argument("--time-gap-hours", type=float, default=6.0)
+    ap.add_argument("--distance-gap-km", type=float, default=80.0)
+    ap.add_argument("--min-event-size", type=int, default=3)
+    ap.add_argument("--max-photos-per-event", type=int, default=40)
+    ap.add_argument("--page-cache-size", type=int, default=64, help="Rendered pages kept in memory")
+    ap.add_argument("--thumb-size", type=int, default=1024, help="Longest edge of served thumbnails")
+    ap.add_argument("--no-background", action="store_true", help="Only serve what is cached; do not run the VLM")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5000)
+    args = ap.parse_args()
+
+    out_dir = os.path.abspath(args.out_dir)
+    events = load_or_build_events(
+        out_dir,
+        args.photo_dir,
+        time_gap_hours=args.time_gap_hours,
+        distance_gap_km=args.distance_gap_km,
+        min_event_size=args.min_event_size,
+        rescan=args.rescan,
+    )
+    if not events:
+        print("No events found. Pass --photo-dir or run piary.run first.")
+        return
+    print(f"Serving {len(events)} events on http://{args.host}:{args.port}/")
+
+    app = create_app(
+        out_dir,
+        events,
+        model=args.model,
+        temperature=args.temperature,
+        max_photos_per_event=args.max_photos_per_event,
+        page_cache_size=args.page_cache_size,
+        thumb_size=args.thumb_size,
+        background=not args.no_background,
+    )
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 
 
 @dataclass
@@ -55,9 +55,31 @@ class EventStory:
     highlights: List[str]
 
 
+@dataclass
+class EventStats:
+    event_id: str
+    month: Optional[str]
+    year: Optional[str]
+    place: Optional[str]
+    num_photos: int
+    object_counts: Dict[str, int]
+    vibe_counts: Dict[str, int]
+    photos_with_people: int
+    num_people: int
+    palette: List[Tuple[str, float]]
+    signature: Optional[str] = None
+
+
 @dataclass
 class MoodBoard:
     top_people: List[str]
     emotion_counts_by_person: Dict[str, Dict[str, int]]
     palette_hex: List[str]
     vibe_words_top: List[str]
+    period: str = ""
+    objects_top: List[str] = field(default_factory=list)
+    palette_weights: List[float] = field(default_factory=list)
+    num_events: int = 0
+    num_photos: int = 0
+    photos_with_people: int = 0
+    num_people: int = 0
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from piary.gphotos import GooglePhotosClient, make_session, sync_google_photos
+
+
+class FakeLibrary:
+    """State behind the stand-in Photos Library API server."""
+
+    def __init__(self, n_items: int) -> None:
+        self.items = [
+            {
+                "id": f"ITEM{i:012d}",
+                "filename": f"IMG_{i:04d}.jpg",
+                "mimeType": "image/jpeg",
+                "mediaMetadata": {"creationTime": f"2025-01-05T07:{i // 60 % 60:02d}:{i % 60:02d}Z"},
+            }
+            for i in range(n_items)
+        ]
+        self.lock = threading.Lock()
+        # key -> queued (status, retry_after) responses served before the real one
+        self.faults: Dict[str, List[Tuple[int, Optional[str]]]] = defaultdict(list)
+        self.stale_tokens = set()
+        self.page_tokens: List[Optional[str]] = []
+        self.hits: Dict[str, int] = defaultdict(int)
+
+    def take_fault(self, key: str) -> Optional[Tuple[int, Optional[str]]]:
+        with self.lock:
+            self.hits[key] += 1
+            return self.faults[key].pop(0) if self.faults[key] else None
+
+
+def _handler(lib: FakeLibrary, base_url: List[str]):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args) -> None:
+            pass
+
+        def _send(self, status: int, body: bytes, ctype: str, retry_after: Optional[str] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            if retry_after is not None:
+                self.send_header("Retry-After", retry_after)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _fault(self, key: str) -> bool:
+            fault = lib.take_fault(key)
+            if fault is None:
+                return False
+            status, retry_after = fault
+            self._send(status, b"{}", "application/json", retry_after)
+            return True
+
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            token = body.get("pageToken")
+            with lib.lock:
+                lib.page_tokens.append(token)
+            if self._fault("search"):
+                return
+            if token in lib.stale_tokens:
+                self._send(400, b'{"error": "invalid page token"}', "application/json")
+                return
+            start = int(token[1:]) if token else 0
+            end = start + int(body.get("pageSize", 100))
+            items = [dict(it, baseUrl=f"{base_url[0]}/media/{it['id']}") for it in lib.items[start:end]]
+            page = {"mediaItems": items}
+            if end < len(lib.items):
+                page["nextPageToken"] = f"p{end}"
+            self._send(200, json.dumps(page).encode(), "application/json")
+
+        def do_GET(self) -> None:
+            item_id = self.path.split("/media/", 1)[1].split("=", 1)[0]
+            if self._fault(item_id):
+                return
+            self._send(200, f"jpeg:{item_id}".encode(), "image/jpeg")
+
+    return Handler
+
+
+@pytest.fixture
+def server():
+    def start(n_items: int) -> Tuple[FakeLibrary, str]:
+        lib = FakeLibrary(n_items)
+        base_url: List[str] = []
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), _handler(lib, base_url))
+        base_url.append(f"http://127.0.0.1:{httpd.server_address[1]}")
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        servers.append(httpd)
+        return lib, base_url[0]
+
+    servers: List[ThreadingHTTPServer] = []
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def _client(base_url: str) -> GooglePhotosClient:
+    return GooglePhotosClient(make_session(pool_size=4), api_base=base_url, rate=0, backoff=0.01, retries=4)
+
+
+def _state(dest: str) -> dict:
+    with open(os.path.join(dest, ".gphotos_state.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _photos(dest: str) -> List[str]:
+    return sorted(n for n in os.listdir(dest) if n.endswith(".jpg"))
+
+
+def test_pages_through_library_and_resumes_from_checkpoint(server, tmp_path):
+    lib, base_url = server(250)
+    broken = lib.items[150]["id"]
+    lib.faults[broken] = [(404, None)]
+    dest = str(tmp_path)
+
+    stats = sync_google_photos(_client(base_url), dest, workers=4, progress=False)
+
+    assert (stats.listed, stats.downloaded, stats.failed) == (250, 249, 1)
+    assert lib.page_tokens == [None, "p100", "p200"]
+    # The page holding the failed download is not checkpointed past.
+    assert _state(dest) == {"page_token": "p100"}
+
+    lib.page_tokens.clear()
+    stats = sync_google_photos(_client(base_url), dest, workers=4, progress=False)
+
+    assert lib.page_tokens == ["p100", "p200"]
+    assert (stats.listed, stats.downloaded, stats.failed) == (150, 1, 0)
+    assert len(_photos(dest)) == 250
+    assert _state(dest) == {"page_token": None}
+
+
+@pytest.mark.parametrize("status", [429, 503])
+@pytest.mark.parametrize("retry_after", [None, "0"])
+@pytest.mark.parametrize("target", ["search", "download"])
+def test_retries_throttled_requests(server, tmp_path, status, retry_after, target):
+    lib, base_url = server(5)
+    key = "search" if target == "search" else lib.items[2]["id"]
+    lib.faults[key] = [(status, retry_after), (status, retry_after)]
+
+    stats = sync_google_photos(_client(base_url), str(tmp_path), workers=2, progress=False)
+
+    assert (stats.downloaded, stats.failed) == (5, 0)
+    assert lib.hits[key] == 3
+    assert _state(str(tmp_path)) == {"page_token": None}
+
+
+def test_stale_page_token_restarts_listing(server, tmp_path):
+    lib, base_url = server(120)
+    dest = str(tmp_path)
+    with open(os.path.join(dest, ".gphotos_state.json"), "w", encoding="utf-8") as f:
+        json.dump({"page_token": "expired"}, f)
+    lib.stale_tokens.add("expired")
+
+    stats = sync_google_photos(_client(base_url), dest, workers=4, progress=False)
+
+    assert lib.page_tokens == ["expired", None, "p100"]
+    assert (stats.listed, stats.downloaded) == (120, 120)
+    assert len(_photos(dest)) == 120
+
+
+def test_skips_files_already_on_disk(server, tmp_path):
+    lib, base_url = server(3)
+    dest = str(tmp_path)
+    sync_google_photos(_client(base_url), dest, workers=2, progress=False)
+    existing = os.path.join(dest, _photos(dest)[0])
+    with open(existing, "wb") as f:
+        f.write(b"kept")
+    lib.hits.clear()
+
+    stats = sync_google_photos(_client(base_url), dest, workers=2, progress=False)
+
+    assert (stats.listed, stats.downloaded) == (3, 0)
+    assert not any(k != "search" for k in lib.hits)
+    with open(existing, "rb") as f:
+        assert f.read() == b"kept"
+
+
+def test_skips_originals_the_scanner_cannot_read(server, tmp_path):
+    lib, base_url = server(3)
+    lib.items[1].update(filename="IMG_0001.HEIC", mimeType="image/heif")
+    dest = str(tmp_path)
+
+    stats = sync_google_photos(_client(base_url), dest, max_size=0, workers=2, progress=False)
+
+    assert (stats.listed, stats.downloaded, stats.skipped, stats.failed) == (3, 2, 1, 0)
+    assert lib.hits[lib.items[1]["id"]] == 0
+    assert len(_photos(dest)) == 2
+    assert not [n for n in os.listdir(dest) if n.lower().endswith(".heic")]
+
+    # Sized downloads of the same item come back as JPEG and are kept.
+    stats = sync_google_photos(_client(base_url), dest, workers=2, progress=False)
+
+    assert (stats.downloaded, stats.skipped) == (1, 0)
+    assert len(_photos(dest)) == 3